@@ -5,19 +5,22 @@ import boto3
 import ast
 import re
 
+DURATION_PATTERN = re.compile(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+LAST_NUMBER_PATTERN = re.compile(r'(\d+)(?=\D*$)')
+# One client for the life of the container, shared with lambda_function
+s3 = boto3.client('s3')
+
 def get_audio_duration(file_path):
     result = subprocess.run(
         ["ffmpeg", "-i", file_path, "-f", "null", "-"],
         stderr=subprocess.PIPE, text=True, check=True
     )
-    duration_line = [line for line in result.stderr.split('\n') if "Duration" in line][0]
-    duration_str = duration_line.split(",")[0].split("Duration:")[1].strip()
-    h, m, s = map(float, duration_str.split(":"))
+    h, m, s = map(float, DURATION_PATTERN.search(result.stderr).groups())
     duration = h * 3600 + m * 60 + s
     return duration
 
 def extract_last_numeric_value(filename):
-    matches = re.findall(r'(\d+)(?=\D*$)', filename)
+    matches = LAST_NUMBER_PATTERN.findall(filename)
     if matches:
         # Return the last numeric match as an integer
         return int(matches[-1])
@@ -25,7 +28,6 @@ def extract_last_numeric_value(filename):
     
     
 def get_music(used_music, total_duration):
-    s3 = boto3.client('s3')
     bucket_name = 'audio-er-lambda'
     if used_music is None:
         used_music = []
@@ -107,6 +109,8 @@ def combine_audio_files(Cached, used_music):
     print("Step 2 Complete")
     
     # Step 3: Concatenate the silence and the voice
+    # Keep the remux: the silence file carries an Info header sized for 10s of
+    # audio, and a raw byte join would leave it in front of the whole voice track
     subprocess.run([
         "ffmpeg", "-i", f"concat:{silence_path}|{voice_path}", "-c", "copy", voice_with_silence_path
     ], check=True)
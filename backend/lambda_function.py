@@ -2,25 +2,44 @@ import os
 import json
 import tempfile  
 import base64
+import binascii
 import combine_voice as cv
 import gemini
-import eleven
-import tts
 import openai_voice as ov
 import os
-import boto3
 import random
 from datetime import datetime
 
 combined_meditation_path = "/tmp/combined.mp3"
 temp_voice_path = "/tmp/voice.mp3"
+# Whole base64 quanta (a multiple of 4 characters), so each slice of a string
+# holding only base64 alphabet characters decodes on its own
+BASE64_CHUNK_SIZE = 4 * 64 * 1024
+# combine_voice's client, created once per container, also stores the responses
+# so a cold start only sets up one S3 client
+s3 = cv.s3
+# The full response carries the base64 meditation audio, so only log it on request
+verbose_logging = os.environ.get('VERBOSE_LOGGING') == '1'
 
 def analyze_audio(audio, prompt):
     print("Summary Started")
     if 'NotAvailable' not in audio:
-        audio_bytes = base64.b64decode(audio)
         with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
-            temp_file.write(audio_bytes)
+            # The app sends unwrapped base64; line breaks would shift the slices
+            # off the 4-character quanta, so that input takes the fallback below
+            wrapped = '\n' in audio or '\r' in audio
+            if not wrapped:
+                try:
+                    # Decode a slice at a time so the full decoded audio never sits in memory
+                    for start in range(0, len(audio), BASE64_CHUNK_SIZE):
+                        temp_file.write(binascii.a2b_base64(audio[start:start + BASE64_CHUNK_SIZE]))
+                except binascii.Error:
+                    wrapped = True
+            if wrapped:
+                # Decode in one pass, which skips non-alphabet characters
+                temp_file.seek(0)
+                temp_file.truncate()
+                temp_file.write(base64.b64decode(audio))
             audio = temp_file.name
     result = gemini.getSummary(audio, prompt)
     print(f'Result: {result}')
@@ -30,7 +49,9 @@ def get_meditation_transcript(input_data, music_list):
     result = gemini.getMeditation(input_data)
     print(f'Meditation Text Result: {result}')
     ov.create_openai_voice(result) # Change this to dictate different voice Service: 
-                                   # OpenAi, Google TTS or Eleven Labs
+                                   # OpenAi, Google TTS (tts) or Eleven Labs (eleven).
+                                   # Only the provider in use is imported, to keep
+                                   # cold starts from loading the others' SDKs.
     
     if os.path.exists(temp_voice_path):
         print('OS PATH VOICE EXISTS')
@@ -64,12 +85,14 @@ def lambda_handler(event, context):
     holder['user_id'] = user
     holder['inference_type'] = task
     holder_json = json.dumps(holder)
-    s3 = boto3.client('s3')
     bucket_name = 'float-cust-data'
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
     object_key = f"{user}/{task}/{timestamp}.json"
     object_key_audio = f"{user}/audio/{timestamp}.json"
-    print(str(holder))
+    if verbose_logging:
+        print(holder_json)
+    else:
+        print(f"{task} response: {len(holder_json)} bytes, keys {list(holder)}")
     try:
         s3.put_object(Bucket=bucket_name, Key=object_key, Body=holder_json)
         if event.get('audio') != "NotAvailable":
@@ -85,5 +108,5 @@ def lambda_handler(event, context):
     
     return {
         'statusCode': 200,
-        'body': json.dumps(holder)
+        'body': holder_json
     }
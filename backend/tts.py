@@ -1,92 +1,126 @@
 import sys
 import os
-import time
+import re
+import shutil
+import tempfile
+import functools
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
-from google.cloud import texttospeech
-import subprocess
+MAX_TTS_WORKERS = 8
+COPY_BUFFER_SIZE = 1024 * 1024
+BREAK_PATTERN = re.compile(r'(?=<break)')
+BREAK_TAG_LENGTH = len('<break')
+SSML_START_TAG = '<speak><voice name="en-US-Neural2-J"><google:style name="calm">'
+SSML_END_TAG = '</google:style></voice></speak>'
+# Google TTS caps a request at 5000 bytes of input, counted in UTF-8, and the
+# voice/style wrapper tags around each chunk count against that too
+MAX_TTS_REQUEST_BYTES = 5000
+MAX_SSML_CHUNK_BYTES = MAX_TTS_REQUEST_BYTES - len((SSML_START_TAG + SSML_END_TAG).encode())
 
-client = texttospeech.TextToSpeechClient()
+@functools.lru_cache(maxsize=1)
+def get_client():
+    # Imported and built on first use so importing this module (e.g. just for
+    # split_text) doesn't load google-cloud/gRPC or set up credentials; the
+    # cached client is shared by all worker threads.
+    from google.cloud import texttospeech
+    return texttospeech.TextToSpeechClient()
 
-def split_text(text, max_length):
-    # Split the text by <break> tags
-    parts = text.split('<break')
+def split_text(text, max_bytes):
+    # Split the text in front of each <break> tag, keeping the tag with the
+    # text that follows it. Chunks are sized in UTF-8 bytes, not characters,
+    # since curly quotes and dashes take several bytes each.
+    parts = BREAK_PATTERN.split(text)
     chunks = []
-    current_chunk = ""
-
-    first_iteration = True
-
-    for part in parts:
-        # Skip the first iteration
-        if first_iteration:
-            first_iteration = False
-            current_chunk += part
-            continue
-        if part.strip():
-            part = '<break' + part
-        # Check if adding this part would exceed the max_length
-        if len(current_chunk) + len(part) <= max_length:
-            current_chunk += part
-        else:
-            # If the current chunk is not empty, add it to chunks
-            if current_chunk:
-                chunks.append(current_chunk)
-            # Start a new chunk with the current part
-            current_chunk = part
+    current_chunk = []
+    current_bytes = 0
+
+    for index, part in enumerate(parts):
+        # A bare '<break' with nothing after it is dropped
+        if index and not part[BREAK_TAG_LENGTH:].strip():
+            part = part[BREAK_TAG_LENGTH:]
+        part_bytes = len(part.encode())
+        # Check if adding this part would exceed max_bytes
+        if current_bytes and current_bytes + part_bytes > max_bytes:
+            chunks.append(''.join(current_chunk))
+            current_chunk = []
+            current_bytes = 0
+        current_chunk.append(part)
+        current_bytes += part_bytes
 
     # Add the last chunk if it's not empty
-    if current_chunk:
-        chunks.append(current_chunk)
-    formatted_chunks = []
-    start_tag = '<speak><voice name="en-US-Neural2-J"><google:style name="calm">'
-    end_tag = '</google:style></voice></speak>'
-    for chunk in chunks:
-        formatted_chunk = start_tag + chunk + end_tag
-        
-        formatted_chunks.append(formatted_chunk)
-    return formatted_chunks
+    if current_bytes:
+        chunks.append(''.join(current_chunk))
+    return [SSML_START_TAG + chunk + SSML_END_TAG for chunk in chunks]
+
+def synthesize_chunk(index, ssml_data, chunk_dir):
+    path = os.path.join(chunk_dir, f'tts_voice_{index:04d}.mp3')
+    from google.cloud import texttospeech
+
+    # Set the text input to be synthesized
+    synthesis_input = texttospeech.SynthesisInput(ssml=ssml_data)
+
+    # Define the voice parameters
+    voice = texttospeech.VoiceSelectionParams(
+        language_code='en-US',
+        name='en-US-Neural2-J',
+        ssml_gender=texttospeech.SsmlVoiceGender.MALE
+    )
+
+    # Define the audio configuration
+    audio_config = texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding.MP3
+    )
+
+    # Perform the text-to-speech request on the text input with the selected
+    # voice parameters and audio file type
+    response = get_client().synthesize_speech(
+        input=synthesis_input, voice=voice, audio_config=audio_config
+    )
+    # The response's audio_content is binary.
+    with open(path, "wb") as out:
+        # Write the response to the output file.
+        out.write(response.audio_content)
+        print(f'Audio content written to file {path}')
+
+    return path
 
 def create_tts_meditation(text):
-    chunks = split_text(text, 300)
-    voice_path = '/tmp/voice.mp3'
-    if os.path.exists(voice_path):
-        os.remove(voice_path)
-    paths = []
-    for index, ssml_data in enumerate(chunks):
-        # Set the text input to be synthesized
-        print(index)
+    chunks = split_text(text, MAX_SSML_CHUNK_BYTES)
+    voice_path = Path('/tmp/voice.mp3')
+    voice_path.unlink(missing_ok=True)
+    # Create the client up front so the worker threads don't race to build it
+    get_client()
+    # Each call writes its segments to its own directory so overlapping
+    # meditations can't overwrite each other's chunk files. It sits next to
+    # voice_path, not under TMPDIR, so the single-chunk rename below never
+    # crosses filesystems.
+    chunk_dir = tempfile.mkdtemp(prefix='tts_chunks_', dir=voice_path.parent)
+    try:
+        # Chunks are independent network calls, so synthesize them concurrently;
+        # map() yields the paths back in chunk order for the concat below.
         try:
-            synthesis_input = texttospeech.SynthesisInput(ssml=ssml_data)
-            
-            # Define the voice parameters
-            voice = texttospeech.VoiceSelectionParams(
-                language_code='en-US',
-                name='en-US-Neural2-J',
-                ssml_gender=texttospeech.SsmlVoiceGender.MALE
-            )
-            
-            # Define the audio configuration
-            audio_config = texttospeech.AudioConfig(
-                audio_encoding=texttospeech.AudioEncoding.MP3
-            )
-            
-            # Perform the text-to-speech request on the text input with the selected
-            # voice parameters and audio file type
-            response = client.synthesize_speech(
-                input=synthesis_input, voice=voice, audio_config=audio_config
-            )
-            print(index)
-            # The response's audio_content is binary.
-            {int(time.time())}
-            paths.append(f'/tmp/tts_voice_{int(time.time())}.mp3')
-            with open(paths[index], "wb") as out:
-                # Write the response to the output file.
-                out.write(response.audio_content)
-                print(f'Audio content written to file {paths[index]}')
+            with ThreadPoolExecutor(max_workers=MAX_TTS_WORKERS) as executor:
+                synthesize = functools.partial(synthesize_chunk, chunk_dir=chunk_dir)
+                paths = list(executor.map(synthesize, range(len(chunks)), chunks))
         except Exception as e:
             print(e)
             return
-    
-    concat_paths = '|'.join(paths)
-    subprocess.run(["ffmpeg", "-i", f"concat:{concat_paths}", "-c", "copy", voice_path], check=True)
+
+        if len(paths) == 1:
+            # Most meditations fit in a single request, so there is nothing to join
+            os.replace(paths[0], voice_path)
+            return
+
+        # Google TTS returns bare MP3 frames (no ID3 tag or Xing/Info header), so
+        # appending the segments yields a stream that decodes to the same audio as
+        # an ffmpeg concat remux, minus the ~12 ms of encoder delay the remux's
+        # Info header would have trimmed, without spawning a process for it.
+        with open(voice_path, "wb") as out:
+            for path in paths:
+                with open(path, "rb") as chunk_file:
+                    shutil.copyfileobj(chunk_file, out, COPY_BUFFER_SIZE)
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
 
 